@@ -0,0 +1,68 @@
+from typing import Optional
+import asyncio
+import weakref
+import httpx
+from openai import AsyncOpenAI
+
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE_CONNECTIONS = 32
+REQUEST_TIMEOUT = 60.0
+
+# Pooled connections belong to the event loop that opened them, so each loop gets its own client
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+def create_client(api_key: Optional[str] = None) -> AsyncOpenAI:
+    """
+    Create an AsyncOpenAI client backed by a pooled HTTP/2 connection.
+    
+    Concurrent requests are multiplexed over a small number of kept-alive connections.
+    Those connections belong to the event loop that opened them, so use a client on one
+    loop only and close it before the loop ends. get_client() and close_client() manage
+    one such client per running loop for you. The SDK's own
+    retries are disabled because every request made by anki_utils and
+    modular_anki_utils, including Batch API calls, is retried with backoff by
+    anki_common.retry_transient.
+    
+    Args:
+        api_key: OpenAI API key (default: read from the OPENAI_API_KEY environment variable)
+        
+    Returns:
+        AsyncOpenAI: A client instance using the shared HTTP/2 transport
+    """
+    http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+        ),
+        timeout=httpx.Timeout(REQUEST_TIMEOUT)
+    )
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+def get_client() -> AsyncOpenAI:
+    """
+    Return the AsyncOpenAI client shared by the running event loop, creating it on first use.
+    
+    Every caller on the same loop shares one connection pool, so repeated generator
+    construction does not open new connections or TLS sessions. A later event loop,
+    such as a second asyncio.run(), gets a fresh client instead of reusing connections
+    that belong to a closed loop. Must be called from a coroutine.
+    
+    Returns:
+        AsyncOpenAI: The shared client instance for the running event loop
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = create_client()
+    return client
+
+async def close_client() -> None:
+    """
+    Close the running event loop's shared client, if one was created.
+    
+    Call this before the loop finishes so its pooled connections are released cleanly.
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
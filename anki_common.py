@@ -0,0 +1,39 @@
+import logging
+import os
+import openai
+from tenacity import before_sleep_log, retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+logger = logging.getLogger(__name__)
+
+# Rate limits, timeouts and server errors are transient; bad requests and validation errors are not
+TRANSIENT_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+retry_transient = retry(
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(6),
+    retry=retry_if_exception_type(TRANSIENT_ERRORS),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True
+)
+_WRITE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+
+def strict_json_schema(schema: dict) -> dict:
+    """Close every object in a JSON schema, as required by strict structured outputs."""
+    if schema.get("type") == "object":
+        schema["additionalProperties"] = False
+    for value in schema.values():
+        children = value if isinstance(value, list) else [value]
+        for child in children:
+            if isinstance(child, dict):
+                strict_json_schema(child)
+    return schema
+
+def write_bytes(path: str, data: bytes) -> None:
+    """Write `data` to `path`, replacing any existing file. The directory must already exist."""
+    fd = os.open(path, _WRITE_FLAGS, 0o666)
+    try:
+        # os.write may write fewer bytes than requested, e.g. when the disk is nearly full
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
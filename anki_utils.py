@@ -1,35 +1,90 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional, Tuple, Union
+import asyncio
 import csv
+import hashlib
+import io
+import json
 import os
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from openai import AsyncOpenAI
+from anki_common import retry_transient, strict_json_schema, write_bytes
 from pathlib import Path
+from tqdm import tqdm
+
+MODEL = "gpt-4o"
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "anki-gen")
+_DECK_NAME_TABLE = str.maketrans({'-': ' ', '_': ' '})
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+_MODEL_CONFIG = ConfigDict(frozen=True, extra='forbid', str_strip_whitespace=True)
 
 class AnkiFlashcard(BaseModel):
     """Model representing a single Anki flashcard with question, answer, and tags."""
+    model_config = _MODEL_CONFIG
     question: str = Field(..., description="The front side of the flashcard containing the question")
     answer: str = Field(..., description="The back side of the flashcard containing the answer")
     tags: List[str] = Field(..., description="List of tags associated with the flashcard")
 
 class AnkiDeck(BaseModel):
     """Model representing a complete Anki deck containing multiple flashcards."""
+    model_config = _MODEL_CONFIG
     cards: List[AnkiFlashcard] = Field(..., description="List of flashcards in the deck")
     deck_name: str = Field(..., description="Name of the Anki deck")
 
-def generate_structured_flashcards(
-    client: OpenAI,
+_ANKI_DECK_SCHEMA = strict_json_schema(AnkiDeck.model_json_schema())
+_ANKI_DECK_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "AnkiDeck", "schema": _ANKI_DECK_SCHEMA, "strict": True}
+}
+_SYSTEM_PROMPT_TEMPLATE = """You are an expert at creating Anki flashcards. Your task is to:
+1. Read the provided text
+2. Create {num_cards} Anki flashcards that cover the main concepts
+3. Add relevant tags to each flashcard
+4. Structure the output as an Anki deck with the name "{deck_name}"."""
+
+def _build_messages(text: str, deck_name: str, num_cards: int) -> List[dict]:
+    return [
+        {
+            "role": "system",
+            "content": _SYSTEM_PROMPT_TEMPLATE.format(num_cards=num_cards, deck_name=deck_name)
+        },
+        {
+            "role": "user",
+            "content": f"Please create Anki flashcards for the following text: {text}"
+        }
+    ]
+
+def _cache_path(cache_dir: str, text: str, deck_name: str, num_cards: int) -> Path:
+    key = hashlib.blake2b(f"{MODEL}|{num_cards}|{deck_name}|{text}".encode(), digest_size=16).hexdigest()
+    return Path(cache_dir) / f"{key}.json"
+
+@retry_transient
+async def _create_completion(client: AsyncOpenAI, **kwargs):
+    return await client.chat.completions.create(**kwargs)
+
+@retry_transient
+async def _call_with_retry(call, *args, **kwargs):
+    """Await an SDK call, retrying transient errors so a single failure does not abandon a submitted batch."""
+    return await call(*args, **kwargs)
+
+async def generate_structured_flashcards(
+    client: AsyncOpenAI,
     text: str, 
     deck_name: str, 
-    num_cards: int = 5
+    num_cards: int = 5,
+    cache_dir: Optional[str] = DEFAULT_CACHE_DIR
 ) -> Optional[AnkiDeck]:
     """
     Generate structured flashcards using GPT-4 with enforced Pydantic model output.
     
     Args:
-        client: OpenAI client instance
+        client: AsyncOpenAI client instance
         text: The input text to generate flashcards from
         deck_name: Name for the Anki deck
         num_cards: Number of flashcards to generate (default: 5)
+        cache_dir: Directory for cached responses, or None to disable caching (default: ~/.cache/anki-gen)
         
     Returns:
         Optional[AnkiDeck]: A structured deck of flashcards with proper validation, or None if generation fails
@@ -37,29 +92,32 @@ def generate_structured_flashcards(
     if num_cards < 1:
         raise ValueError("Number of cards must be at least 1")
     
+    cache_path = _cache_path(cache_dir, text, deck_name, num_cards) if cache_dir else None
+    if cache_path and cache_path.exists():
+        try:
+            return AnkiDeck.model_validate_json(cache_path.read_text(encoding='utf-8'))
+        except Exception as e:
+            tqdm.write(f"Ignoring unreadable cache entry {cache_path}: {str(e)}")
+    
     try:
-        completion = client.beta.chat.completions.parse(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"""You are an expert at creating Anki flashcards. Your task is to:
-1. Read the provided text
-2. Create {num_cards} Anki flashcards that cover the main concepts
-3. Add relevant tags to each flashcard
-4. Structure the output as an Anki deck with the name "{deck_name}"."""
-                },
-                {
-                    "role": "user",
-                    "content": f"Please create Anki flashcards for the following text: {text}"
-                }
-            ],
-            response_format=AnkiDeck,
+        completion = await _create_completion(
+            client,
+            model=MODEL,
+            messages=_build_messages(text, deck_name, num_cards),
+            response_format=_ANKI_DECK_RESPONSE_FORMAT,
         )
-        return completion.choices[0].message.parsed
+        deck = AnkiDeck.model_validate_json(completion.choices[0].message.content)
     except Exception as e:
-        print(f"Error generating flashcards: {str(e)}")
+        tqdm.write(f"Error generating flashcards: {str(e)}")
         return None
+    
+    if deck and cache_path:
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            cache_path.write_text(deck.model_dump_json(), encoding='utf-8')
+        except OSError as e:
+            tqdm.write(f"Error writing cache entry {cache_path}: {str(e)}")
+    return deck
 
 def write_deck_to_csv(deck: AnkiDeck, output_path: str) -> bool:
     """
@@ -67,77 +125,148 @@ def write_deck_to_csv(deck: AnkiDeck, output_path: str) -> bool:
     
     Args:
         deck: The AnkiDeck to write
-        output_path: Path where the CSV file should be saved
+        output_path: Path where the CSV file should be saved; its directory must already exist
         
     Returns:
         bool: True if successful, False otherwise
     """
     try:
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        join = ', '.join
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['Question', 'Answer', 'Tags'])
+        writer.writerows((card.question, card.answer, join(card.tags)) for card in deck.cards)
+        data = buffer.getvalue().encode('utf-8')
         
-        with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(['Question', 'Answer', 'Tags'])
-            for card in deck.cards:
-                writer.writerow([card.question, card.answer, ', '.join(card.tags)])
+        write_bytes(output_path, data)
         return True
     except Exception as e:
-        print(f"Error writing deck to CSV: {str(e)}")
+        tqdm.write(f"Error writing deck to CSV: {str(e)}")
+        return False
+
+def _markdown_entries(input_dir: str) -> List[os.DirEntry]:
+    with os.scandir(input_dir) as entries:
+        return [entry for entry in entries if entry.is_file() and entry.name.endswith('.md')]
+
+def _is_up_to_date(entry: os.DirEntry, output_path: str) -> bool:
+    try:
+        return os.stat(output_path).st_mtime >= entry.stat().st_mtime
+    except FileNotFoundError:
         return False
 
-def process_markdown_to_anki(
-    client: OpenAI,
+def _output_path(output_dir: str, filename: str) -> str:
+    return os.path.join(output_dir, Path(filename).stem + '-flashcards.csv')
+
+def _directory_jobs(input_dir: str, output_dir: str, force: bool) -> List[Tuple[str, str, str, str]]:
+    """List (filename, input_path, output_path, deck_name) for every markdown file that needs processing."""
+    jobs = []
+    skipped = 0
+    for entry in _markdown_entries(input_dir):
+        output_path = _output_path(output_dir, entry.name)
+        if not force and _is_up_to_date(entry, output_path):
+            skipped += 1
+            continue
+        jobs.append((entry.name, entry.path, output_path, Path(entry).stem.translate(_DECK_NAME_TABLE).title()))
+    if skipped:
+        print(f"Skipping {skipped} files whose flashcards are up to date")
+    return jobs
+
+def _read_markdown(markdown_path: str) -> str:
+    return Path(markdown_path).read_text(encoding='utf-8')
+
+def _read_markdown_files(markdown_paths: List[str]) -> List[Union[str, Exception]]:
+    """Read markdown files on a thread pool, returning the exception for any file that cannot be read."""
+    def read(markdown_path: str) -> Union[str, Exception]:
+        try:
+            return _read_markdown(markdown_path)
+        except Exception as e:
+            return e
+    
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        return list(pool.map(read, markdown_paths))
+
+async def _text_to_anki(
+    client: AsyncOpenAI,
+    text: str,
+    output_path: str,
+    deck_name: str,
+    num_cards: int,
+    cache_dir: Optional[str]
+) -> Optional[AnkiDeck]:
+    deck = await generate_structured_flashcards(
+        client=client,
+        text=text, 
+        deck_name=deck_name,
+        num_cards=num_cards,
+        cache_dir=cache_dir
+    )
+    if deck and write_deck_to_csv(deck, output_path):
+        return deck
+    return None
+
+async def process_markdown_to_anki(
+    client: AsyncOpenAI,
     markdown_path: str, 
     output_path: str, 
     deck_name: str, 
-    num_cards: int = 5
+    num_cards: int = 5,
+    cache_dir: Optional[str] = DEFAULT_CACHE_DIR
 ) -> Optional[AnkiDeck]:
     """
     Process a markdown file into Anki flashcards and save them as CSV.
     
     Args:
-        client: OpenAI client instance
+        client: AsyncOpenAI client instance
         markdown_path: Path to the input markdown file
         output_path: Path where the CSV file should be saved
         deck_name: Name for the Anki deck
         num_cards: Number of flashcards to generate (default: 5)
+        cache_dir: Directory for cached responses, or None to disable caching (default: ~/.cache/anki-gen)
         
     Returns:
         Optional[AnkiDeck]: The generated deck object if successful, None otherwise
     """
     try:
-        with open(markdown_path, "r", encoding='utf-8') as file:
-            markdown_content = file.read()
+        markdown_content = await asyncio.to_thread(_read_markdown, markdown_path)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
-        deck = generate_structured_flashcards(
+        return await _text_to_anki(
             client=client,
-            text=markdown_content, 
+            text=markdown_content,
+            output_path=output_path,
             deck_name=deck_name,
-            num_cards=num_cards
+            num_cards=num_cards,
+            cache_dir=cache_dir
         )
         
-        if deck and write_deck_to_csv(deck, output_path):
-            return deck
-        return None
-        
     except Exception as e:
         print(f"Error processing markdown to Anki: {str(e)}")
         return None
 
-def process_directory_to_anki(
-    client: OpenAI,
+async def process_directory_to_anki(
+    client: AsyncOpenAI,
     input_dir: str, 
     output_dir: str, 
-    num_cards: int = 5
+    num_cards: int = 5,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+    force: bool = False
 ) -> List[AnkiDeck]:
     """
     Process all markdown files in a directory into Anki flashcards and save them as CSV files.
     
+    All files are read up front on a thread pool, then processed concurrently with at most
+    `max_concurrency` API requests in flight. Files whose CSV is newer than the markdown
+    source are skipped unless `force` is set.
+    
     Args:
-        client: OpenAI client instance
+        client: AsyncOpenAI client instance
         input_dir: Directory containing markdown files
         output_dir: Directory where CSV files should be saved
         num_cards: Number of flashcards to generate per deck (default: 5)
+        max_concurrency: Maximum number of concurrent API requests (default: 16)
+        cache_dir: Directory for cached responses, or None to disable caching (default: ~/.cache/anki-gen)
+        force: Regenerate decks even if their CSV is up to date (default: False)
         
     Returns:
         List[AnkiDeck]: List of all successfully generated deck objects
@@ -146,31 +275,215 @@ def process_directory_to_anki(
         raise FileNotFoundError(f"Input directory not found: {input_dir}")
     
     os.makedirs(output_dir, exist_ok=True)
+    files = _directory_jobs(input_dir, output_dir, force)
+    contents = await asyncio.to_thread(_read_markdown_files, [input_path for _, input_path, _, _ in files])
+    
+    semaphore = asyncio.Semaphore(max_concurrency)
+    progress = tqdm(total=len(files), desc="decks", unit="deck")
+    
+    async def bounded(coro):
+        async with semaphore:
+            try:
+                return await coro
+            finally:
+                progress.update(1)
+    
+    jobs = []
+    for (filename, _, output_path, deck_name), content in zip(files, contents):
+        if isinstance(content, Exception):
+            progress.write(f"Error processing {filename}: {str(content)}")
+            progress.update(1)
+            continue
+        
+        task = bounded(_text_to_anki(
+            client=client,
+            text=content,
+            output_path=output_path,
+            deck_name=deck_name,
+            num_cards=num_cards,
+            cache_dir=cache_dir
+        ))
+        jobs.append((filename, task))
+    
+    results = await asyncio.gather(*(task for _, task in jobs), return_exceptions=True)
+    progress.close()
+    
     generated_decks = []
+    for (filename, _), result in zip(jobs, results):
+        if isinstance(result, Exception):
+            print(f"Error processing {filename}: {str(result)}")
+        elif result:
+            generated_decks.append(result)
+    
+    print(f"\nProcessing complete!")
+    print(f"Processed {len(generated_decks)} files")
+    print(f"Output files can be found in: {output_dir}")
+    
+    return generated_decks
+
+async def submit_directory_batch(
+    client: AsyncOpenAI,
+    input_dir: str,
+    output_dir: str,
+    num_cards: int = 5,
+    force: bool = False
+) -> Optional[str]:
+    """
+    Submit every markdown file in a directory that needs processing as one OpenAI Batch API job.
+    
+    Args:
+        client: AsyncOpenAI client instance
+        input_dir: Directory containing markdown files
+        output_dir: Directory where CSV files will be saved, used to skip up-to-date files
+        num_cards: Number of flashcards to generate per deck (default: 5)
+        force: Regenerate decks even if their CSV is up to date (default: False)
+        
+    Returns:
+        Optional[str]: The batch id to pass to collect_batch, or None if there was nothing to submit
+    """
+    if not os.path.exists(input_dir):
+        raise FileNotFoundError(f"Input directory not found: {input_dir}")
+    if num_cards < 1:
+        raise ValueError("Number of cards must be at least 1")
+    
+    lines = []
+    files = _directory_jobs(input_dir, output_dir, force)
+    contents = await asyncio.to_thread(_read_markdown_files, [input_path for _, input_path, _, _ in files])
+    for (filename, _, _, deck_name), content in zip(files, contents):
+        if isinstance(content, Exception):
+            print(f"Error processing {filename}: {str(content)}")
+            continue
+        
+        lines.append(json.dumps({
+            "custom_id": filename,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": MODEL,
+                "messages": _build_messages(content, deck_name, num_cards),
+                "response_format": _ANKI_DECK_RESPONSE_FORMAT
+            }
+        }))
+    
+    if not lines:
+        print(f"No markdown files to process in: {input_dir}")
+        return None
+    
+    batch_input = await _call_with_retry(
+        client.files.create,
+        file=("anki-batch.jsonl", "\n".join(lines).encode('utf-8')),
+        purpose="batch"
+    )
+    batch = await _call_with_retry(
+        client.batches.create,
+        input_file_id=batch_input.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    print(f"Submitted batch {batch.id} with {len(lines)} requests")
+    return batch.id
+
+async def collect_batch(
+    client: AsyncOpenAI,
+    batch_id: str,
+    output_dir: str,
+    poll_interval: float = 30.0
+) -> List[AnkiDeck]:
+    """
+    Wait for a batch submitted by submit_directory_batch to finish and save its decks as CSV files.
+    
+    The batch id printed on submission is enough to collect the results from a later run.
+    
+    Args:
+        client: AsyncOpenAI client instance
+        batch_id: Id of the submitted batch
+        output_dir: Directory where CSV files should be saved
+        poll_interval: Seconds to wait between batch status checks (default: 30)
+        
+    Returns:
+        List[AnkiDeck]: List of all successfully generated deck objects
+    """
+    batch = await _call_with_retry(client.batches.retrieve, batch_id)
+    while batch.status not in BATCH_TERMINAL_STATUSES:
+        await asyncio.sleep(poll_interval)
+        batch = await _call_with_retry(client.batches.retrieve, batch.id)
+    
+    if batch.status != "completed":
+        print(f"Batch {batch.id} finished with status: {batch.status}")
+    # Expired and cancelled batches still return, and bill for, the requests that finished
+    if batch.status == "failed" or not (batch.output_file_id or batch.error_file_id):
+        return []
     
-    for filename in os.listdir(input_dir):
-        if filename.endswith('.md'):
-            input_path = os.path.join(input_dir, filename)
-            output_filename = filename.replace('.md', '-flashcards.csv')
-            output_path = os.path.join(output_dir, output_filename)
-            deck_name = filename[:-3].replace('-', ' ').replace('_', ' ').title()
-            
+    os.makedirs(output_dir, exist_ok=True)
+    generated_decks = []
+    if batch.output_file_id:
+        output = await _call_with_retry(client.files.content, batch.output_file_id)
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            filename = result["custom_id"]
+            output_path = _output_path(output_dir, filename)
             try:
-                deck = process_markdown_to_anki(
-                    client=client,
-                    markdown_path=input_path,
-                    output_path=output_path,
-                    deck_name=deck_name,
-                    num_cards=num_cards
-                )
-                if deck:
+                if result.get("error"):
+                    raise RuntimeError(result["error"])
+                content = result["response"]["body"]["choices"][0]["message"]["content"]
+                deck = AnkiDeck.model_validate_json(content)
+                if write_deck_to_csv(deck, output_path):
                     generated_decks.append(deck)
-                    print(f"Successfully processed {filename} -> {output_filename}")
+                    print(f"Successfully processed {filename} -> {os.path.basename(output_path)}")
             except Exception as e:
                 print(f"Error processing {filename}: {str(e)}")
     
+    # Requests that failed inside the batch are only reported in the error file
+    if batch.error_file_id:
+        errors = await _call_with_retry(client.files.content, batch.error_file_id)
+        for line in errors.text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            error = result.get("error") or ((result.get("response") or {}).get("body") or {}).get("error")
+            if isinstance(error, dict):
+                error = error.get("message", error)
+            print(f"Error processing {result['custom_id']}: {error}")
+    
     print(f"\nProcessing complete!")
     print(f"Processed {len(generated_decks)} files")
     print(f"Output files can be found in: {output_dir}")
     
-    return generated_decks 
\ No newline at end of file
+    return generated_decks
+
+async def process_directory_to_anki_batch(
+    client: AsyncOpenAI,
+    input_dir: str, 
+    output_dir: str, 
+    num_cards: int = 5,
+    poll_interval: float = 30.0,
+    force: bool = False,
+    batch_id: Optional[str] = None
+) -> List[AnkiDeck]:
+    """
+    Process all markdown files in a directory through the OpenAI Batch API and save them as CSV files.
+    
+    Batch requests are billed at a lower rate but may take up to 24 hours to complete,
+    so this is intended for offline generation of decks for a whole corpus. If the run is
+    interrupted while waiting, pass the printed batch id as `batch_id` to collect the
+    results without submitting the files again.
+    
+    Args:
+        client: AsyncOpenAI client instance
+        input_dir: Directory containing markdown files
+        output_dir: Directory where CSV files should be saved
+        num_cards: Number of flashcards to generate per deck (default: 5)
+        poll_interval: Seconds to wait between batch status checks (default: 30)
+        force: Regenerate decks even if their CSV is up to date (default: False)
+        batch_id: Id of an already submitted batch to collect instead of submitting a new one (default: None)
+        
+    Returns:
+        List[AnkiDeck]: List of all successfully generated deck objects
+    """
+    if batch_id is None:
+        batch_id = await submit_directory_batch(client, input_dir, output_dir, num_cards=num_cards, force=force)
+        if batch_id is None:
+            return []
+    return await collect_batch(client, batch_id, output_dir, poll_interval=poll_interval)
@@ -1,19 +1,19 @@
-from openai import OpenAI
+import asyncio
+from anki_client import close_client
 from modular_anki_utils import FlashcardGenerator, DeckWriter, MarkdownProcessor
 from dotenv import load_dotenv
 
-def main():
+async def main():
     # Load environment variables
     load_dotenv()
         
-    # Initialize components
-    client = OpenAI()
-    generator = FlashcardGenerator(client)
+    # Initialize components (the generator uses the shared client from anki_client)
+    generator = FlashcardGenerator()
     writer = DeckWriter()
     processor = MarkdownProcessor(generator, writer)
 
     # Process a single file
-    deck = processor.process_file(
+    deck = await processor.process_file(
         markdown_path="assets/essays/romantic-essay.md",
         output_path="assets/flashcards/romantic-flashcards.csv",
         deck_name="Romantic Period"
@@ -23,10 +23,12 @@ def main():
         print("Successfully generated romantic flashcards!")
 
     # Process an entire directory
-    decks = processor.process_directory(
+    decks = await processor.process_directory(
         input_dir="assets/essays",
         output_dir="assets/test-decks"
     )
 
+    await close_client()
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    asyncio.run(main())
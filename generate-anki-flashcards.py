@@ -1,24 +1,15 @@
 # Import required libraries
+import csv
+import os
+from typing import List
+
 from dotenv import load_dotenv  # For loading environment variables
 from openai import OpenAI 
-
-# Load environment variables from .env file 
-load_dotenv()
-
-# Initialize OpenAI client using API key from environment variables
-client = OpenAI()
-
-# Load and read the contents of the baroque essay markdown file
-with open("assets/essays/baroque-essay.md", "r") as file:
-    baroque = file.read()
+from pydantic import BaseModel, Field  # For data validation and typing
 
 #%%
-# Print the contents of the baroque essay (for debugging/verification)
-print(baroque)
-# %%
-
-#%%
-def generate_response(text,
+def generate_response(client,
+        text,
         model="gpt-4o", 
         temperature=1.0, 
         top_p=1.0, 
@@ -28,6 +19,7 @@ def generate_response(text,
     Generate flashcard content using OpenAI's API.
     
     Args:
+        client (OpenAI): OpenAI client instance
         text (str): Input text to generate flashcards from
         model (str): OpenAI model to use
         temperature (float): Controls randomness (0-1)
@@ -83,24 +75,6 @@ def parse_response(response):
     # Extract the content from each choice in the response
     return [choice.message.content for choice in response.choices]
 
-#%%
-# Generate multiple responses for the baroque text
-responses = generate_response(baroque, n=2)
-
-#%% 
-# Parse the generated responses into a list of strings
-parsed_responses = parse_response(responses)
-
-#%%
-# Print each response with an index number
-for idx, content in enumerate(parsed_responses, 1):
-    print(f"Response {idx}:\n{content}\n")
-
-# %%
-# Import Pydantic for data validation and typing
-from pydantic import BaseModel, Field
-from typing import List
-
 #%%
 class AnkiFlashcard(BaseModel):
     """
@@ -120,11 +94,12 @@ class AnkiDeck(BaseModel):
     deck_name: str = Field(..., description="Name of the Anki deck")
 
 # %%
-def generate_structured_flashcards(text: str, deck_name: str, num_cards: int = 5) -> AnkiDeck:
+def generate_structured_flashcards(client: OpenAI, text: str, deck_name: str, num_cards: int = 5) -> AnkiDeck:
     """
     Generate structured flashcards using GPT-4o with enforced Pydantic model output.
     
     Args:
+        client (OpenAI): OpenAI client instance
         text (str): The input text to generate flashcards from
         deck_name (str): Name for the Anki deck
         num_cards (int): Number of flashcards to generate (default: 5)
@@ -162,47 +137,13 @@ def generate_structured_flashcards(text: str, deck_name: str, num_cards: int = 5
     # Return the parsed response
     return completion.choices[0].message.parsed
 
-#%%
-# Generate a deck of flashcards for the baroque text
-baroque_deck = generate_structured_flashcards(baroque, "Baroque Period")
-# %%
-# Display the entire deck
-baroque_deck
-#%%
-# Display just the cards from the deck
-baroque_deck.cards
-
-# %%
-# Print each card's details in a formatted way
-for card in baroque_deck.cards:
-    print(f"Question: {card.question}")
-    print(f"Answer: {card.answer}")
-    print(f"Tags: {', '.join(card.tags)}")
-    print("-" * 20)
-
-# %%
-# Import libraries for file operations
-import csv
-import os
-#%%
-# Create directory for flashcard output if it doesn't exist
-os.makedirs('assets/flashcards', exist_ok=True)
-
-# Export flashcards to CSV file
-with open('assets/flashcards/baroque-flashcards.csv', 'w', newline='', encoding='utf-8') as csvfile:
-    writer = csv.writer(csvfile)
-    # Write header row
-    writer.writerow(['Question', 'Answer', 'Tags'])
-    # Write each flashcard as a row in the CSV
-    for card in baroque_deck.cards:
-        writer.writerow([card.question, card.answer, ', '.join(card.tags)])
-
 # %%
-def process_markdown_to_anki(markdown_path: str, output_path: str, deck_name: str, num_cards: int = 5) -> AnkiDeck:
+def process_markdown_to_anki(client: OpenAI, markdown_path: str, output_path: str, deck_name: str, num_cards: int = 5) -> AnkiDeck:
     """
     Process a markdown file into Anki flashcards and save them as CSV.
     
     Args:
+        client (OpenAI): OpenAI client instance
         markdown_path (str): Path to the input markdown file
         output_path (str): Path where the CSV file should be saved
         deck_name (str): Name for the Anki deck
@@ -221,6 +162,7 @@ def process_markdown_to_anki(markdown_path: str, output_path: str, deck_name: st
     
     # Generate the Anki deck
     deck = generate_structured_flashcards(
+        client=client,
         text=markdown_content, 
         deck_name=deck_name,
         num_cards=num_cards
@@ -240,20 +182,14 @@ def process_markdown_to_anki(markdown_path: str, output_path: str, deck_name: st
     
     return deck
 
-# Example usage:
-modern_deck = process_markdown_to_anki(
-    markdown_path="assets/essays/modern-essay.md",
-    output_path="assets/flashcards/modern-flashcards.csv",
-    deck_name="Modern Period"
-)
-
 # %%
 
-def process_directory_to_anki(input_dir: str, output_dir: str, num_cards: int = 5) -> List[AnkiDeck]:
+def process_directory_to_anki(client: OpenAI, input_dir: str, output_dir: str, num_cards: int = 5) -> List[AnkiDeck]:
     """
     Process all markdown files in a directory into Anki flashcards and save them as CSV files.
     
     Args:
+        client (OpenAI): OpenAI client instance
         input_dir (str): Directory containing markdown files
         output_dir (str): Directory where CSV files should be saved
         num_cards (int): Number of flashcards to generate per deck (default: 5)
@@ -289,6 +225,7 @@ def process_directory_to_anki(input_dir: str, output_dir: str, num_cards: int =
             try:
                 # Process the file with specified number of cards
                 deck = process_markdown_to_anki(
+                    client=client,
                     markdown_path=input_path,
                     output_path=output_path,
                     deck_name=deck_name,
@@ -307,11 +244,68 @@ def process_directory_to_anki(input_dir: str, output_dir: str, num_cards: int =
     return generated_decks
 
 #%%
-# Example usage:
-decks = process_directory_to_anki(
-    input_dir="assets/essays",
-    output_dir="assets/anki-decks",
-    num_cards=10
-)
+def main():
+    """Run the walkthrough: compare raw responses, then build structured decks and export them as CSV."""
+    # Load environment variables from .env file 
+    load_dotenv()
+
+    # Initialize OpenAI client using API key from environment variables
+    client = OpenAI()
+
+    # Load and read the contents of the baroque essay markdown file
+    with open("assets/essays/baroque-essay.md", "r") as file:
+        baroque = file.read()
+
+    # Print the contents of the baroque essay (for debugging/verification)
+    print(baroque)
+
+    # Generate multiple responses for the baroque text
+    responses = generate_response(client, baroque, n=2)
+
+    # Parse the generated responses into a list of strings
+    parsed_responses = parse_response(responses)
+
+    # Print each response with an index number
+    for idx, content in enumerate(parsed_responses, 1):
+        print(f"Response {idx}:\n{content}\n")
 
+    # Generate a deck of flashcards for the baroque text
+    baroque_deck = generate_structured_flashcards(client, baroque, "Baroque Period")
+
+    # Print each card's details in a formatted way
+    for card in baroque_deck.cards:
+        print(f"Question: {card.question}")
+        print(f"Answer: {card.answer}")
+        print(f"Tags: {', '.join(card.tags)}")
+        print("-" * 20)
+
+    # Create directory for flashcard output if it doesn't exist
+    os.makedirs('assets/flashcards', exist_ok=True)
+
+    # Export flashcards to CSV file
+    with open('assets/flashcards/baroque-flashcards.csv', 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        # Write header row
+        writer.writerow(['Question', 'Answer', 'Tags'])
+        # Write each flashcard as a row in the CSV
+        for card in baroque_deck.cards:
+            writer.writerow([card.question, card.answer, ', '.join(card.tags)])
+
+    # Process a single markdown file end to end
+    modern_deck = process_markdown_to_anki(
+        client=client,
+        markdown_path="assets/essays/modern-essay.md",
+        output_path="assets/flashcards/modern-flashcards.csv",
+        deck_name="Modern Period"
+    )
+
+    # Process every markdown file in a directory
+    decks = process_directory_to_anki(
+        client=client,
+        input_dir="assets/essays",
+        output_dir="assets/anki-decks",
+        num_cards=10
+    )
 
+if __name__ == "__main__":
+    main()
@@ -1,77 +1,481 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import asyncio
 import csv
+import hashlib
+import io
+import json
+import math
 import os
-from openai import OpenAI
+import re
+from concurrent.futures import ThreadPoolExecutor
+from openai import AsyncOpenAI
+from anki_client import get_client
+from anki_common import retry_transient, strict_json_schema, write_bytes
+from functools import lru_cache
 from pathlib import Path
+import tiktoken
+from tqdm import tqdm
+
+MODEL = "gpt-4o"
+DEFAULT_MAX_CONCURRENCY = 16
+# Decks at least this large are streamed so the connection stays active while the model writes
+STREAM_MIN_CARDS = 20
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "anki-gen")
+_DECK_NAME_TABLE = str.maketrans({'-': ' ', '_': ' '})
+DEFAULT_BATCH_SIZE = 4
+# Texts longer than this are split into chunks that are processed in parallel
+DEFAULT_MAX_CHUNK_TOKENS = 6000
+
+_MODEL_CONFIG = ConfigDict(frozen=True, extra='forbid', str_strip_whitespace=True)
 
 class AnkiFlashcard(BaseModel):
     """Model representing a single Anki flashcard with question, answer, and tags."""
+    model_config = _MODEL_CONFIG
     question: str = Field(..., description="The front side of the flashcard containing the question")
     answer: str = Field(..., description="The back side of the flashcard containing the answer")
     tags: List[str] = Field(..., description="List of tags associated with the flashcard")
 
 class AnkiDeck(BaseModel):
     """Model representing a complete Anki deck containing multiple flashcards."""
+    model_config = _MODEL_CONFIG
     cards: List[AnkiFlashcard] = Field(..., description="List of flashcards in the deck")
     deck_name: str = Field(..., description="Name of the Anki deck")
 
+class AnkiDeckBatch(BaseModel):
+    """Model representing several Anki decks generated in a single request."""
+    model_config = _MODEL_CONFIG
+    decks: List[AnkiDeck] = Field(..., description="List of decks, one per input text, in input order")
+
+@lru_cache(maxsize=None)
+def _encoding() -> tiktoken.Encoding:
+    return tiktoken.get_encoding("o200k_base")
+
+def _count_tokens(text: str) -> int:
+    return len(_encoding().encode(text, disallowed_special=()))
+
+def _split_markdown(text: str, max_tokens: int = DEFAULT_MAX_CHUNK_TOKENS) -> List[str]:
+    """Split markdown into chunks of at most `max_tokens`, on top-level headings and then on paragraphs.
+    
+    A single paragraph longer than `max_tokens` is kept whole as its own chunk.
+    """
+    units = []
+    for section in re.split(r'(?m)^(?=# )', text):
+        if not section.strip():
+            continue
+        tokens = _count_tokens(section)
+        if tokens <= max_tokens:
+            units.append((section, tokens))
+        else:
+            units.extend(
+                (paragraph, _count_tokens(paragraph))
+                for paragraph in re.split(r'\n\s*\n', section) if paragraph.strip()
+            )
+    
+    chunks = []
+    current = []
+    current_tokens = 0
+    for unit, tokens in units:
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(unit)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+class _JsonObjectScanner:
+    """Find the JSON objects that close at a given nesting depth in text that arrives in pieces.
+    
+    Each piece is scanned once, so the cost is linear in the length of the whole text.
+    """
+    def __init__(self, depth: int):
+        self.depth = depth
+        self.count = 0
+        self._level = 0
+        self._in_string = False
+        self._escaped = False
+        self._current: Optional[List[str]] = None
+
+    def feed(self, text: str) -> List[Tuple[int, str]]:
+        """Return the (index, JSON text) of every object at `depth` that is completed by this piece."""
+        found = []
+        start = 0
+        for pos, char in enumerate(text):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._level += 1
+                if char == '{' and self._level == self.depth:
+                    self._current = []
+                    start = pos
+            elif char in '}]':
+                if char == '}' and self._level == self.depth and self._current is not None:
+                    self._current.append(text[start:pos + 1])
+                    found.append((self.count, ''.join(self._current)))
+                    self.count += 1
+                    self._current = None
+                self._level -= 1
+        if self._current is not None:
+            self._current.append(text[start:])
+        return found
+
+def _response_format(model: type) -> dict:
+    schema = strict_json_schema(model.model_json_schema())
+    return {"type": "json_schema", "json_schema": {"name": model.__name__, "schema": schema, "strict": True}}
+
+_ANKI_DECK_RESPONSE_FORMAT = _response_format(AnkiDeck)
+_ANKI_DECK_BATCH_RESPONSE_FORMAT = _response_format(AnkiDeckBatch)
+_SYSTEM_PROMPT_TEMPLATE = """You are an expert at creating Anki flashcards. Your task is to:
+1. Read the provided text
+2. Create {num_cards} Anki flashcards that cover the main concepts
+3. Add relevant tags to each flashcard
+4. Structure the output as an Anki deck with the name "{deck_name}"."""
+_BATCH_SYSTEM_PROMPT_TEMPLATE = """You are an expert at creating Anki flashcards. You will receive a JSON array of {num_texts} objects, each with a "deck_name" and a "text". For each object, in order:
+1. Read the provided text
+2. Create {num_cards} Anki flashcards that cover the main concepts
+3. Add relevant tags to each flashcard
+4. Structure the output as an Anki deck with the given deck name.
+Return exactly one deck per object, in the same order as the input."""
+
 class FlashcardGenerator:
-    def __init__(self, client: OpenAI):
-        self.client = client
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+        max_chunk_tokens: int = DEFAULT_MAX_CHUNK_TOKENS
+    ):
+        self._client = client
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_chunk_tokens = max_chunk_tokens
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """The client passed in, or the shared client of the running event loop."""
+        return self._client or get_client()
+
+    def count_tokens(self, text: str) -> int:
+        """Count the tokens of a text that might need splitting.
+        
+        Texts with at most `max_chunk_tokens` UTF-8 bytes are not tokenized, because every token is at least one byte.
+        If the tokenizer is unavailable the count is 0, so the text is sent whole rather than failing.
+        """
+        if len(text.encode('utf-8')) <= self.max_chunk_tokens:
+            return 0
+        try:
+            return _count_tokens(text)
+        except Exception as e:
+            tqdm.write(f"Could not count tokens, sending the text without splitting: {str(e)}")
+            return 0
+
+    def needs_split(self, text: str, token_count: Optional[int] = None) -> bool:
+        """Return True if the text is too long to send in a single request. Pass `token_count` if already known."""
+        if token_count is None:
+            token_count = self.count_tokens(text)
+        return token_count > self.max_chunk_tokens
+
+    def is_cached(self, text: str, deck_name: str, num_cards: int) -> bool:
+        """Return True if a deck for these inputs is in the cache."""
+        cache_path = self._cache_path(text, deck_name, num_cards)
+        return cache_path is not None and cache_path.exists()
+
+    def _cache_path(self, text: str, deck_name: str, num_cards: int) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        key = hashlib.blake2b(f"{MODEL}|{num_cards}|{deck_name}|{text}".encode(), digest_size=16).hexdigest()
+        return self.cache_dir / f"{key}.json"
+
+    def _load_cached(self, text: str, deck_name: str, num_cards: int) -> Optional[AnkiDeck]:
+        """Return the cached deck for these inputs, if any."""
+        cache_path = self._cache_path(text, deck_name, num_cards)
+        if cache_path is None or not cache_path.exists():
+            return None
+        try:
+            return AnkiDeck.model_validate_json(cache_path.read_text(encoding='utf-8'))
+        except Exception as e:
+            tqdm.write(f"Ignoring unreadable cache entry {cache_path}: {str(e)}")
+            return None
+
+    def _store_cached(self, deck: AnkiDeck, text: str, deck_name: str, num_cards: int) -> None:
+        """Store a generated deck in the cache."""
+        cache_path = self._cache_path(text, deck_name, num_cards)
+        if cache_path is None:
+            return
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            cache_path.write_text(deck.model_dump_json(), encoding='utf-8')
+        except OSError as e:
+            tqdm.write(f"Error writing cache entry {cache_path}: {str(e)}")
+
+    @retry_transient
+    async def _create_completion(self, **kwargs):
+        return await self.client.chat.completions.create(**kwargs)
+
+    @retry_transient
+    async def _stream_json_completion(
+        self,
+        on_object: Optional[Callable[[int, str], None]] = None,
+        object_depth: int = 1,
+        **kwargs
+    ) -> str:
+        """Stream a structured-output completion, calling `on_object` with the index and JSON text of each object
+        nested `object_depth` levels deep (counting objects and arrays) as soon as it is complete."""
+        parts = []
+        scanner = _JsonObjectScanner(object_depth) if on_object else None
+        async with await self.client.chat.completions.create(stream=True, **kwargs) as stream:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                parts.append(delta)
+                if scanner:
+                    for index, content in scanner.feed(delta):
+                        on_object(index, content)
+        return "".join(parts)
+
+    async def _request_deck(self, text: str, deck_name: str, num_cards: int) -> AnkiDeck:
+        request = dict(
+            model=MODEL,
+            messages=[
+                {
+                    "role": "system",
+                    "content": _SYSTEM_PROMPT_TEMPLATE.format(num_cards=num_cards, deck_name=deck_name)
+                },
+                {
+                    "role": "user",
+                    "content": f"Please create Anki flashcards for the following text: {text}"
+                }
+            ],
+            response_format=_ANKI_DECK_RESPONSE_FORMAT,
+        )
+        if num_cards >= STREAM_MIN_CARDS:
+            content = await self._stream_json_completion(**request)
+        else:
+            completion = await self._create_completion(**request)
+            content = completion.choices[0].message.content
+        return AnkiDeck.model_validate_json(content)
+
+    async def _request_chunked_deck(
+        self,
+        text: str,
+        deck_name: str,
+        num_cards: int,
+        semaphore: Optional[asyncio.Semaphore] = None
+    ) -> AnkiDeck:
+        """Generate a deck for a long text by requesting cards for each chunk in parallel and merging them.
+        
+        Each chunk gets an equal share of `num_cards`, rounded up, cards with identical questions are dropped,
+        and the merged deck is trimmed back to `num_cards`.
+        Chunk requests hold a permit of `semaphore` while in flight.
+        """
+        chunks = await asyncio.to_thread(_split_markdown, text, self.max_chunk_tokens)
+        cards_per_chunk = math.ceil(num_cards / len(chunks))
+        semaphore = semaphore or asyncio.Semaphore(DEFAULT_MAX_CONCURRENCY)
+        
+        async def bounded(chunk: str) -> AnkiDeck:
+            async with semaphore:
+                return await self._request_deck(chunk, deck_name, cards_per_chunk)
+        
+        decks = await asyncio.gather(*(bounded(chunk) for chunk in chunks))
+        
+        cards = []
+        questions = set()
+        for deck in decks:
+            for card in deck.cards:
+                if card.question not in questions:
+                    questions.add(card.question)
+                    cards.append(card)
+        return AnkiDeck(cards=cards[:num_cards], deck_name=deck_name)
+
+    async def generate_deck(
+        self,
+        text: str,
+        deck_name: str,
+        num_cards: int = 5,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        token_count: Optional[int] = None
+    ) -> Optional[AnkiDeck]:
+        """Generate structured flashcards using GPT-4 with enforced Pydantic model output.
+        
+        If the text has to be split, each chunk request holds a permit of `semaphore`, which the caller must not hold.
+        `token_count` saves tokenizing the text again when the caller has already counted it.
+        """
+        if num_cards < 1:
+            raise ValueError("Number of cards must be at least 1")
+        
+        cached = self._load_cached(text, deck_name, num_cards)
+        if cached:
+            return cached
+        
+        try:
+            if token_count is None:
+                token_count = await asyncio.to_thread(self.count_tokens, text)
+            if self.needs_split(text, token_count):
+                deck = await self._request_chunked_deck(text, deck_name, num_cards, semaphore)
+            else:
+                deck = await self._request_deck(text, deck_name, num_cards)
+        except Exception as e:
+            tqdm.write(f"Error generating flashcards: {str(e)}")
+            return None
+        
+        self._store_cached(deck, text, deck_name, num_cards)
+        return deck
 
-    def generate_deck(self, text: str, deck_name: str, num_cards: int = 5) -> Optional[AnkiDeck]:
-        """Generate structured flashcards using GPT-4 with enforced Pydantic model output."""
+    async def generate_decks_batched(
+        self,
+        texts: List[Tuple[str, str]],
+        num_cards: int = 5,
+        on_deck: Optional[Callable[[int, AnkiDeck], None]] = None
+    ) -> Optional[List[AnkiDeck]]:
+        """Generate one deck per (deck_name, text) pair using a single API request for the uncached pairs.
+        
+        The response is streamed, and `on_deck` is called with the input index and deck as soon as
+        each generated deck is complete, before the rest of the response has arrived.
+        """
         if num_cards < 1:
             raise ValueError("Number of cards must be at least 1")
         
+        decks = [self._load_cached(text, deck_name, num_cards) for deck_name, text in texts]
+        missing = [i for i, deck in enumerate(decks) if deck is None]
+        if not missing:
+            return decks
+        
+        def emit_completed_deck(index: int, content: str) -> None:
+            if index >= len(missing):
+                raise ValueError("Batched generation returned an unexpected number of decks")
+            deck = AnkiDeck.model_validate_json(content)
+            deck_name = texts[missing[index]][0]
+            if deck.deck_name != deck_name:
+                raise ValueError(f"Batched generation returned deck {deck.deck_name!r} where {deck_name!r} was expected")
+            on_deck(missing[index], deck)
+        
         try:
-            completion = self.client.beta.chat.completions.parse(
-                model="gpt-4o",
+            content = await self._stream_json_completion(
+                on_object=emit_completed_deck if on_deck else None,
+                # Each deck is an object inside the "decks" array of the top-level object
+                object_depth=3,
+                model=MODEL,
                 messages=[
                     {
                         "role": "system",
-                        "content": f"""You are an expert at creating Anki flashcards. Your task is to:
-1. Read the provided text
-2. Create {num_cards} Anki flashcards that cover the main concepts
-3. Add relevant tags to each flashcard
-4. Structure the output as an Anki deck with the name "{deck_name}"."""
+                        "content": _BATCH_SYSTEM_PROMPT_TEMPLATE.format(num_texts=len(missing), num_cards=num_cards)
                     },
                     {
                         "role": "user",
-                        "content": f"Please create Anki flashcards for the following text: {text}"
+                        "content": "Please create Anki flashcards for the following texts: " + json.dumps(
+                            [{"deck_name": texts[i][0], "text": texts[i][1]} for i in missing]
+                        )
                     }
                 ],
-                response_format=AnkiDeck,
+                response_format=_ANKI_DECK_BATCH_RESPONSE_FORMAT,
             )
-            return completion.choices[0].message.parsed
+            batch = AnkiDeckBatch.model_validate_json(content)
         except Exception as e:
-            print(f"Error generating flashcards: {str(e)}")
+            tqdm.write(f"Error generating batched flashcards: {str(e)}")
             return None
+        
+        if len(batch.decks) != len(missing):
+            tqdm.write("Batched generation returned an unexpected number of decks")
+            return None
+        # Decks are matched to inputs by position, so a reordered or renamed deck invalidates the whole batch
+        for i, deck in zip(missing, batch.decks):
+            if deck.deck_name != texts[i][0]:
+                tqdm.write(f"Batched generation returned deck {deck.deck_name!r} where {texts[i][0]!r} was expected")
+                return None
+        for i, deck in zip(missing, batch.decks):
+            decks[i] = deck
+            self._store_cached(deck, texts[i][1], texts[i][0], num_cards)
+        return decks
 
 class DeckWriter:
     @staticmethod
     def write_to_csv(deck: AnkiDeck, output_path: str) -> bool:
-        """Write an AnkiDeck to a CSV file."""
+        """Write an AnkiDeck to a CSV file. The output directory must already exist."""
         try:
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            join = ', '.join
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(['Question', 'Answer', 'Tags'])
+            writer.writerows((card.question, card.answer, join(card.tags)) for card in deck.cards)
+            data = buffer.getvalue().encode('utf-8')
             
-            with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(['Question', 'Answer', 'Tags'])
-                for card in deck.cards:
-                    writer.writerow([card.question, card.answer, ', '.join(card.tags)])
+            write_bytes(output_path, data)
             return True
         except Exception as e:
-            print(f"Error writing deck to CSV: {str(e)}")
+            tqdm.write(f"Error writing deck to CSV: {str(e)}")
             return False
 
+    @staticmethod
+    def remove(output_path: str) -> None:
+        """Remove a CSV written from a response that was later rejected, so it is not mistaken for up to date."""
+        try:
+            os.remove(output_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            tqdm.write(f"Error removing {output_path}: {str(e)}")
+
 class MarkdownProcessor:
-    def __init__(self, generator: FlashcardGenerator, writer: DeckWriter):
+    def __init__(
+        self,
+        generator: FlashcardGenerator,
+        writer: DeckWriter,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ):
         self.generator = generator
         self.writer = writer
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size
+
+    @staticmethod
+    def _markdown_entries(input_dir: str) -> List[os.DirEntry]:
+        with os.scandir(input_dir) as entries:
+            return [entry for entry in entries if entry.is_file() and entry.name.endswith('.md')]
+
+    @staticmethod
+    def _is_up_to_date(entry: os.DirEntry, output_path: str) -> bool:
+        try:
+            return os.stat(output_path).st_mtime >= entry.stat().st_mtime
+        except FileNotFoundError:
+            return False
 
-    def process_file(
+    @staticmethod
+    def _read_markdown(markdown_path: str) -> str:
+        return Path(markdown_path).read_text(encoding='utf-8')
+
+    def _load_markdown_files(
+        self,
+        jobs: List[Tuple[str, str]],
+        num_cards: int
+    ) -> List[Union[Tuple[str, Optional[int]], Exception]]:
+        """Read (markdown_path, deck_name) jobs on a thread pool, with the token count of each file that is not cached.
+        
+        The exception is returned for any file that cannot be read.
+        """
+        def load(job: Tuple[str, str]) -> Union[Tuple[str, Optional[int]], Exception]:
+            markdown_path, deck_name = job
+            try:
+                content = self._read_markdown(markdown_path)
+                if self.generator.is_cached(content, deck_name, num_cards):
+                    return content, None
+                return content, self.generator.count_tokens(content)
+            except Exception as e:
+                return e
+        
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+            return list(pool.map(load, jobs))
+
+    async def process_file(
         self,
         markdown_path: str, 
         output_path: str, 
@@ -80,16 +484,19 @@ class MarkdownProcessor:
     ) -> Optional[AnkiDeck]:
         """Process a markdown file into Anki flashcards and save them as CSV."""
         try:
-            with open(markdown_path, "r", encoding='utf-8') as file:
-                markdown_content = file.read()
+            markdown_content = await asyncio.to_thread(self._read_markdown, markdown_path)
             
-            deck = self.generator.generate_deck(
+            deck = await self.generator.generate_deck(
                 text=markdown_content, 
                 deck_name=deck_name,
                 num_cards=num_cards
             )
             
-            if deck and self.writer.write_to_csv(deck, output_path):
+            if not deck:
+                return None
+            
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            if self.writer.write_to_csv(deck, output_path):
                 return deck
             return None
             
@@ -97,41 +504,133 @@ class MarkdownProcessor:
             print(f"Error processing markdown to Anki: {str(e)}")
             return None
 
-    def process_directory(
+    async def process_batch(
+        self,
+        jobs: List[Tuple[str, str, str]],
+        num_cards: int = 5
+    ) -> List[Optional[AnkiDeck]]:
+        """Process (markdown_text, output_path, deck_name) jobs with one API request, falling back to one per file.
+        
+        The fallback requests are made one after another, so the batch never has more than one request in flight.
+        """
+        texts = [(deck_name, text) for text, _, deck_name in jobs]
+        streamed: Dict[int, AnkiDeck] = {}
+        
+        def write_streamed_deck(i: int, deck: AnkiDeck) -> None:
+            if self.writer.write_to_csv(deck, jobs[i][1]):
+                streamed[i] = deck
+        
+        decks = None
+        if len(texts) > 1:
+            decks = await self.generator.generate_decks_batched(
+                texts, num_cards=num_cards, on_deck=write_streamed_deck
+            )
+        if decks is None:
+            # Decks streamed from a rejected response are not trusted, so regenerate every file one by one.
+            # The caller holds a single concurrency permit for this batch, so the requests are not made in parallel.
+            decks = [
+                await self.generator.generate_deck(text=text, deck_name=deck_name, num_cards=num_cards)
+                for deck_name, text in texts
+            ]
+            for i in streamed:
+                if decks[i] is None:
+                    self.writer.remove(jobs[i][1])
+            streamed.clear()
+        
+        # Streamed decks were validated and written on arrival, so only cached and regenerated decks are written here
+        return [
+            deck if deck and (i in streamed or self.writer.write_to_csv(deck, output_path)) else None
+            for i, (deck, (_, output_path, _)) in enumerate(zip(decks, jobs))
+        ]
+
+    async def process_directory(
         self,
         input_dir: str, 
         output_dir: str, 
-        num_cards: int = 5
+        num_cards: int = 5,
+        force: bool = False
     ) -> List[AnkiDeck]:
-        """Process all markdown files in a directory into Anki flashcards."""
+        """Process all markdown files in a directory into Anki flashcards, several files per request, concurrently.
+        
+        Files whose CSV is newer than the markdown source are skipped unless `force` is set.
+        """
         if not os.path.exists(input_dir):
             raise FileNotFoundError(f"Input directory not found: {input_dir}")
         
         os.makedirs(output_dir, exist_ok=True)
-        generated_decks = []
+        pending = []
+        skipped = 0
+        for entry in self._markdown_entries(input_dir):
+            stem = Path(entry).stem
+            output_path = os.path.join(output_dir, stem + '-flashcards.csv')
+            if not force and self._is_up_to_date(entry, output_path):
+                skipped += 1
+                continue
+            pending.append((entry.name, entry.path, output_path, stem.translate(_DECK_NAME_TABLE).title()))
+        if skipped:
+            print(f"Skipping {skipped} files whose flashcards are up to date")
+        
+        loaded = await asyncio.to_thread(
+            self._load_markdown_files,
+            [(input_path, deck_name) for _, input_path, _, deck_name in pending],
+            num_cards
+        )
         
-        for filename in os.listdir(input_dir):
-            if filename.endswith('.md'):
-                input_path = os.path.join(input_dir, filename)
-                output_filename = filename.replace('.md', '-flashcards.csv')
-                output_path = os.path.join(output_dir, output_filename)
-                deck_name = filename[:-3].replace('-', ' ').replace('_', ' ').title()
-                
+        files = []
+        oversized = []
+        for (filename, _, output_path, deck_name), result in zip(pending, loaded):
+            if isinstance(result, Exception):
+                print(f"Error processing {filename}: {str(result)}")
+                continue
+            content, token_count = result
+            # Cached decks are never split, so their token count is not needed
+            if token_count is not None and self.generator.needs_split(content, token_count):
+                oversized.append((filename, (content, output_path, deck_name), token_count))
+            else:
+                files.append((filename, (content, output_path, deck_name)))
+        
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        progress = tqdm(total=len(files) + len(oversized), desc="decks", unit="deck")
+        
+        async def bounded(chunk):
+            async with semaphore:
                 try:
-                    deck = self.process_file(
-                        markdown_path=input_path,
-                        output_path=output_path,
-                        deck_name=deck_name,
-                        num_cards=num_cards
-                    )
-                    if deck:
-                        generated_decks.append(deck)
-                        print(f"Successfully processed {filename} -> {output_filename}")
-                except Exception as e:
-                    print(f"Error processing {filename}: {str(e)}")
+                    return await self.process_batch([job for _, job in chunk], num_cards=num_cards)
+                finally:
+                    progress.update(len(chunk))
+        
+        async def split(chunk):
+            # Each chunk request of a long essay takes its own permit, so the essay is not wrapped in one
+            (_, (content, output_path, deck_name), token_count), = chunk
+            try:
+                deck = await self.generator.generate_deck(
+                    content, deck_name, num_cards, semaphore=semaphore, token_count=token_count
+                )
+                return [deck if deck and self.writer.write_to_csv(deck, output_path) else None]
+            finally:
+                progress.update(1)
+        
+        # Long essays are split by the generator, so they are never packed into a batch
+        split_chunks = [[file] for file in oversized]
+        batch_chunks = [files[i:i + self.batch_size] for i in range(0, len(files), self.batch_size)]
+        chunks = split_chunks + batch_chunks
+        results = await asyncio.gather(
+            *(split(chunk) for chunk in split_chunks),
+            *(bounded(chunk) for chunk in batch_chunks),
+            return_exceptions=True
+        )
+        progress.close()
+        
+        generated_decks = []
+        for chunk, result in zip(chunks, results):
+            for i, (filename, *_) in enumerate(chunk):
+                if isinstance(result, Exception):
+                    print(f"Error processing {filename}: {str(result)}")
+                elif result[i]:
+                    generated_decks.append(result[i])
         
         print(f"\nProcessing complete!")
         print(f"Processed {len(generated_decks)} files")
         print(f"Output files can be found in: {output_dir}")
         
-        return generated_decks 
\ No newline at end of file
+        return generated_decks
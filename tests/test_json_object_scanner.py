@@ -0,0 +1,45 @@
+import json
+import unittest
+
+from modular_anki_utils import _JsonObjectScanner
+
+def scan(text: str, depth: int, piece_size: int):
+    scanner = _JsonObjectScanner(depth)
+    found = []
+    for start in range(0, len(text), piece_size):
+        found.extend(scanner.feed(text[start:start + piece_size]))
+    return found
+
+class JsonObjectScannerTest(unittest.TestCase):
+    def test_reports_each_deck_in_a_batch(self):
+        batch = {"decks": [
+            {"cards": [{"question": "Q1", "answer": "A1", "tags": ["a"]}], "deck_name": "One"},
+            {"cards": [], "deck_name": "Two"}
+        ]}
+        found = scan(json.dumps(batch), depth=3, piece_size=len(json.dumps(batch)))
+        self.assertEqual([index for index, _ in found], [0, 1])
+        self.assertEqual([json.loads(content) for _, content in found], batch["decks"])
+
+    def test_ignores_braces_and_escaped_quotes_inside_strings(self):
+        deck = {"cards": [{"question": 'What does "{x}" mean?', "answer": 'A \\"} ] [ {', "tags": ["}"]}],
+                "deck_name": "Tricky \"name\" {"}
+        text = json.dumps({"decks": [deck]})
+        found = scan(text, depth=3, piece_size=len(text))
+        self.assertEqual([json.loads(content) for _, content in found], [deck])
+
+    def test_objects_split_across_pieces(self):
+        decks = [{"cards": [{"question": f"Q{i} \"}}\"", "answer": "\\", "tags": []}], "deck_name": f"D{i}"}
+                 for i in range(3)]
+        text = json.dumps({"decks": decks})
+        for piece_size in (1, 2, 3, 7, 16):
+            with self.subTest(piece_size=piece_size):
+                found = scan(text, depth=3, piece_size=piece_size)
+                self.assertEqual([json.loads(content) for _, content in found], decks)
+
+    def test_incomplete_object_is_not_reported(self):
+        text = json.dumps({"decks": [{"cards": [], "deck_name": "Done"}, {"cards": [], "deck_name": "Open"}]})
+        found = scan(text[:text.rindex("}", 0, -2)], depth=3, piece_size=5)
+        self.assertEqual([json.loads(content)["deck_name"] for _, content in found], ["Done"])
+
+if __name__ == "__main__":
+    unittest.main()
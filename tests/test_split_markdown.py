@@ -0,0 +1,52 @@
+import unittest
+from unittest import mock
+
+import modular_anki_utils
+from modular_anki_utils import _split_markdown
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+def words(n: int, prefix: str) -> str:
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+@mock.patch.object(modular_anki_utils, "_count_tokens", count_words)
+class SplitMarkdownTest(unittest.TestCase):
+    def assertKeepsAllWords(self, text, chunks):
+        self.assertEqual(" ".join(chunks).split(), text.split())
+
+    def test_short_text_is_one_chunk(self):
+        text = f"# One\n\n{words(3, 'a')}\n\n# Two\n\n{words(3, 'b')}\n"
+        chunks = _split_markdown(text, max_tokens=100)
+        self.assertEqual(len(chunks), 1)
+        self.assertKeepsAllWords(text, chunks)
+
+    def test_preamble_before_first_heading_is_kept(self):
+        text = f"{words(4, 'intro')}\n\n# One\n\n{words(4, 'a')}\n\n# Two\n\n{words(4, 'b')}\n"
+        chunks = _split_markdown(text, max_tokens=8)
+        self.assertEqual(chunks[0].split(), words(4, 'intro').split())
+        self.assertEqual([chunk.split()[0] for chunk in chunks[1:]], ["#", "#"])
+        self.assertKeepsAllWords(text, chunks)
+
+    def test_sections_are_packed_up_to_the_limit(self):
+        text = f"# One\n\n{words(3, 'a')}\n\n# Two\n\n{words(3, 'b')}\n\n# Three\n\n{words(3, 'c')}\n"
+        chunks = _split_markdown(text, max_tokens=10)
+        self.assertEqual([count_words(chunk) for chunk in chunks], [10, 5])
+        self.assertKeepsAllWords(text, chunks)
+
+    def test_section_too_long_to_fit_is_split_on_paragraphs(self):
+        text = f"# Long\n\n{words(5, 'a')}\n\n{words(5, 'b')}\n\n{words(5, 'c')}\n"
+        chunks = _split_markdown(text, max_tokens=12)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(count_words(chunk) <= 12 for chunk in chunks))
+        self.assertKeepsAllWords(text, chunks)
+
+    def test_paragraph_longer_than_limit_is_its_own_chunk(self):
+        text = f"# Long\n\n{words(2, 'a')}\n\n{words(20, 'huge')}\n\n{words(2, 'b')}\n"
+        chunks = _split_markdown(text, max_tokens=10)
+        self.assertIn(words(20, 'huge'), chunks)
+        self.assertTrue(all(count_words(chunk) <= 10 for chunk in chunks if 'huge0' not in chunk))
+        self.assertKeepsAllWords(text, chunks)
+
+if __name__ == "__main__":
+    unittest.main()